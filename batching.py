@@ -0,0 +1,147 @@
+"""
+Dynamic batching of concurrent single-sample predictions
+"""
+import asyncio
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from kernel import infer_batch, make_kernel
+
+
+class MicroBatcher:
+    """
+    Fuse concurrent single-sample predictions into one matmul.
+
+    Requests are queued and a background task takes everything already
+    waiting (up to ``max_batch_size`` items), stacks it into an ``(N, 4)``
+    matrix, runs the vectorized kernel once and resolves each request's
+    future. A lone request runs straight away through a single-sample
+    kernel; only when other requests are already pending does the task
+    wait up to ``max_wait_ms`` for more, so batches form under load without
+    delaying light traffic. The task starts on first use if ``start`` was
+    not called.
+    ``kernel(x, out)`` defaults to ``make_kernel(W, b)``, and
+    ``batch_kernel`` maps the stacked matrix to
+    ``(probabilities, predictions)`` and defaults to ``infer_batch`` with
+    ``W`` and ``b``.
+    """
+
+    def __init__(
+        self,
+        W: np.ndarray,
+        b: np.ndarray,
+        max_batch_size: int = 64,
+        max_wait_ms: float = 2.0,
+        kernel: Optional[Callable] = None,
+        batch_kernel: Optional[Callable] = None
+    ):
+        self.b = b
+        self.kernel = kernel or make_kernel(W, b)
+        self.batch_kernel = batch_kernel or (lambda X: infer_batch(X, W, b))
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _ensure_started(self):
+        """Start the background batching task if it is not running on the current loop"""
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            if self._task is not None and not self._task.done():
+                self._abandon(self._task, self._queue)
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run(self._queue))
+
+    @staticmethod
+    def _abandon(task: asyncio.Task, queue: asyncio.Queue):
+        """Cancel a task left on another event loop, failing its requests if that loop is gone"""
+        try:
+            task.get_loop().call_soon_threadsafe(task.cancel)
+        except RuntimeError:
+            # The loop is closed, so the task's cleanup will never run
+            MicroBatcher._fail_pending(queue, [])
+
+    @staticmethod
+    def _fail_pending(queue: asyncio.Queue, items: List[Tuple[np.ndarray, asyncio.Future]]):
+        """Fail the given requests and everything still queued"""
+        while not queue.empty():
+            items.append(queue.get_nowait())
+
+        for _, future in items:
+            if not future.done():
+                try:
+                    future.set_exception(RuntimeError("batcher stopped"))
+                except RuntimeError:
+                    # The future's event loop is already closed
+                    pass
+
+    async def start(self):
+        """Start the background batching task on the running event loop"""
+        self._ensure_started()
+
+    async def stop(self):
+        """Stop the background batching task, failing any requests it has not answered"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def predict(self, x: np.ndarray) -> Tuple[int, np.ndarray]:
+        """Queue one float32 sample and wait for its (class index, probabilities)"""
+        self._ensure_started()
+        future = self._loop.create_future()
+        self._queue.put_nowait((x, future))
+        return await future
+
+    def _drain(self, queue: asyncio.Queue, items: List[Tuple[np.ndarray, asyncio.Future]]):
+        """Move already queued requests into ``items`` until the batch is full"""
+        while len(items) < self.max_batch_size and not queue.empty():
+            items.append(queue.get_nowait())
+
+    async def _collect(self, queue: asyncio.Queue, items: List[Tuple[np.ndarray, asyncio.Future]]):
+        """Wait for the next request and gather the ones already queued behind it into ``items``"""
+        items.append(await queue.get())
+        self._drain(queue, items)
+
+        # A lone request runs immediately; under load, give stragglers a
+        # short window to join the batch. A plain sleep is used rather than
+        # wait_for(queue.get()), which can swallow a cancellation from stop()
+        # when the get completes at the same time.
+        if 1 < len(items) < self.max_batch_size:
+            await asyncio.sleep(self.max_wait)
+            self._drain(queue, items)
+
+    async def _run(self, queue: asyncio.Queue):
+        items = []
+        try:
+            while True:
+                items = []
+                await self._collect(queue, items)
+
+                try:
+                    if len(items) == 1:
+                        # Nothing to fuse with, use the single-sample kernel
+                        probabilities = np.empty(len(self.b), dtype=np.float32)
+                        prediction = self.kernel(items[0][0], probabilities)
+                        results = [(prediction, probabilities)]
+                    else:
+                        P, preds = self.batch_kernel(np.stack([x for x, _ in items]))
+                        results = [(int(pred), row) for pred, row in zip(preds, P)]
+                except Exception as e:
+                    for _, future in items:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+
+                for (_, future), result in zip(items, results):
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            # Stopped or crashed: nothing will answer these requests now
+            self._fail_pending(queue, items)
@@ -0,0 +1,38 @@
+/* Generated by train_model.py from the trained weights. Do not edit. */
+#include <math.h>
+
+#define N_CLASSES 3
+
+static const float W[N_CLASSES][4] = {
+    {-0.529545307f, 0.827264667f, -2.34737325f, -0.993393064f},
+    {0.529709935f, -0.304722011f, -0.170953691f, -0.856067538f},
+    {-0.00016464229f, -0.522542596f, 2.51832676f, 1.8494606f}
+};
+
+static const float b[N_CLASSES] = {10.1255217f, 1.79758203f, -11.9231033f};
+
+int infer(const float *x, float *probs)
+{
+    probs[0] = b[0] + W[0][0] * x[0] + W[0][1] * x[1] + W[0][2] * x[2] + W[0][3] * x[3];
+    probs[1] = b[1] + W[1][0] * x[0] + W[1][1] * x[1] + W[1][2] * x[2] + W[1][3] * x[3];
+    probs[2] = b[2] + W[2][0] * x[0] + W[2][1] * x[1] + W[2][2] * x[2] + W[2][3] * x[3];
+
+    float z_max = probs[0];
+    for (int i = 1; i < N_CLASSES; i++)
+        if (probs[i] > z_max)
+            z_max = probs[i];
+
+    float total = 0.0f;
+    for (int i = 0; i < N_CLASSES; i++) {
+        probs[i] = expf(probs[i] - z_max);
+        total += probs[i];
+    }
+
+    int best = 0;
+    for (int i = 0; i < N_CLASSES; i++) {
+        probs[i] /= total;
+        if (probs[i] > probs[best])
+            best = i;
+    }
+    return best;
+}
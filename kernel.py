@@ -0,0 +1,225 @@
+"""
+Inference kernels for the Iris logistic regression model
+
+Holds the Numba single-sample kernel, the NumPy and int8 batch kernels,
+the ONNX Runtime session helpers, and generation, building and cffi
+loading of the C kernel. Importing this module pulls in numba,
+onnxruntime and cffi.
+"""
+import os
+import subprocess
+
+import numpy as np
+import onnxruntime as ort
+from cffi import FFI
+from numba import njit
+
+
+@njit(cache=True, fastmath=True)
+def _softmax_argmax(out):
+    """Apply softmax to ``out`` in place and return the index of the largest entry"""
+    z_max = out[0]
+    for i in range(1, out.shape[0]):
+        if out[i] > z_max:
+            z_max = out[i]
+
+    total = 0.0
+    for i in range(out.shape[0]):
+        out[i] = np.exp(out[i] - z_max)
+        total += out[i]
+
+    best = 0
+    for i in range(out.shape[0]):
+        out[i] /= total
+        if out[i] > out[best]:
+            best = i
+
+    return best
+
+
+def make_kernel(W, b):
+    """
+    Build a single-sample kernel specialized for fixed weights.
+
+    ``W`` and ``b`` are captured as constant arrays, so Numba bakes their
+    values and shapes into the compiled code and LLVM fully unrolls the
+    matmul. The returned ``kernel(x, out)`` writes the softmax of
+    ``W @ x + b`` into the caller-supplied ``out`` buffer and returns the
+    index of the most probable class. It is cached on disk per set of
+    weights.
+    """
+    W = np.ascontiguousarray(W, dtype=np.float32)
+    b = np.ascontiguousarray(b, dtype=np.float32)
+    n_classes, n_features = W.shape
+
+    @njit(cache=True, fastmath=True)
+    def kernel(x, out):
+        for i in range(n_classes):
+            acc = b[i]
+            for j in range(n_features):
+                acc += W[i, j] * x[j]
+            out[i] = acc
+
+        return _softmax_argmax(out)
+
+    return kernel
+
+
+def generate_c_kernel(W, b):
+    """
+    Generate C source for a single-sample kernel with fixed weights.
+
+    ``W`` and ``b`` are emitted as ``static const`` arrays and the matmul is
+    fully unrolled. The exported ``int infer(const float *x, float *probs)``
+    has the same contract as the kernel returned by ``make_kernel``.
+    """
+    W = np.asarray(W, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    n_classes, n_features = W.shape
+
+    def literal(v):
+        return f"{float(v):.9g}f"
+
+    rows = ",\n".join(
+        "    {" + ", ".join(literal(v) for v in row) + "}" for row in W
+    )
+    logits = "\n".join(
+        f"    probs[{i}] = b[{i}] + "
+        + " + ".join(f"W[{i}][{j}] * x[{j}]" for j in range(n_features))
+        + ";"
+        for i in range(n_classes)
+    )
+
+    return f"""/* Generated by train_model.py from the trained weights. Do not edit. */
+#include <math.h>
+
+#define N_CLASSES {n_classes}
+
+static const float W[N_CLASSES][{n_features}] = {{
+{rows}
+}};
+
+static const float b[N_CLASSES] = {{{", ".join(literal(v) for v in b)}}};
+
+int infer(const float *x, float *probs)
+{{
+{logits}
+
+    float z_max = probs[0];
+    for (int i = 1; i < N_CLASSES; i++)
+        if (probs[i] > z_max)
+            z_max = probs[i];
+
+    float total = 0.0f;
+    for (int i = 0; i < N_CLASSES; i++) {{
+        probs[i] = expf(probs[i] - z_max);
+        total += probs[i];
+    }}
+
+    int best = 0;
+    for (int i = 0; i < N_CLASSES; i++) {{
+        probs[i] /= total;
+        if (probs[i] > probs[best])
+            best = i;
+    }}
+    return best;
+}}
+"""
+
+
+def build_c_kernel(source_path="kernel.c", library_path="_kernel.so"):
+    """Compile the generated C kernel into a shared library for this machine"""
+    subprocess.run(
+        ["cc", "-O3", "-march=native", "-shared", "-fPIC", source_path, "-o", library_path, "-lm"],
+        check=True
+    )
+
+
+def load_c_kernel(library_path="_kernel.so"):
+    """
+    Load the compiled C kernel through cffi.
+
+    Returns a ``kernel(x, out)`` callable with the same contract as the one
+    from ``make_kernel``; ``x`` and ``out`` must be contiguous float32 arrays.
+    The call is wrapped in ``njit`` so argument conversion happens in
+    compiled code; calling ``lib.infer`` from Python costs several times
+    more than the kernel itself.
+    """
+    ffi = FFI()
+    ffi.cdef("int infer(const float *x, float *probs);")
+    lib = ffi.dlopen(os.path.abspath(library_path))
+    c_infer = lib.infer
+
+    @njit
+    def kernel(x, out):
+        return c_infer(ffi.from_buffer(x), ffi.from_buffer(out))
+
+    return kernel
+
+
+def infer_batch(X, W, b):
+    """
+    Compute class probabilities for a batch of samples.
+
+    Runs one ``X @ W.T + b`` matmul with a row-wise softmax and returns the
+    ``(N, n_classes)`` probability matrix and the predicted class per row.
+    """
+    Z = X @ W.T + b
+    Z -= Z.max(axis=1, keepdims=True)
+    P = np.exp(Z)
+    P /= P.sum(axis=1, keepdims=True)
+    return P, P.argmax(axis=1)
+
+
+def quantize_weights(W):
+    """
+    Quantize a weight matrix to int8 with one scale per row.
+
+    Returns ``(W_q, s_w)`` such that ``W ~= W_q * s_w[:, None]``.
+    """
+    s_w = (np.abs(W).max(axis=1) / 127).astype(np.float32)
+    s_w[s_w == 0] = 1
+    W_q = np.round(W / s_w[:, None]).astype(np.int8)
+    return W_q, s_w
+
+
+def infer_batch_int8(X, W_q, s_w, b):
+    """
+    Compute class probabilities for a batch of samples with int8 weights.
+
+    Each sample is quantized to int8 with its own scale, the logits are
+    accumulated in int32 and rescaled to float32 before the softmax.
+    Returns the same ``(P, preds)`` pair as ``infer_batch``.
+    """
+    s_x = np.abs(X).max(axis=1) / 127
+    s_x[s_x == 0] = 1
+    X_q = np.round(X / s_x[:, None]).astype(np.int32)
+
+    Z = (X_q @ W_q.astype(np.int32).T).astype(np.float32)
+    Z *= s_x[:, None] * s_w
+    Z += b
+    Z -= Z.max(axis=1, keepdims=True)
+    P = np.exp(Z)
+    P /= P.sum(axis=1, keepdims=True)
+    return P, P.argmax(axis=1)
+
+
+def load_onnx_session(path):
+    """
+    Open an ONNX Runtime session for the exported model.
+
+    Graph optimizations fuse the matmul, bias and softmax, and the CPU
+    memory arena reuses tensor buffers across calls. One intra-op thread is
+    plenty for this model; concurrency comes from the server instead.
+    """
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = 1
+    options.enable_cpu_mem_arena = True
+    return ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+def infer_batch_onnx(session, X):
+    """Run a float32 ``(N, 4)`` batch through ONNX Runtime, returning ``(P, preds)``"""
+    preds, P = session.run(["label", "probabilities"], {"X": X})
+    return P, preds
@@ -1,27 +1,207 @@
 """
 FastAPI application for Iris flower classification
 """
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse
-from pydantic import BaseModel, Field, field_validator
+import os
+
+# The model is a 3x4 matmul, so BLAS fork/join costs far more than the math
+# itself. Keep BLAS/OpenMP single-threaded (before NumPy is imported) and get
+# concurrency from Uvicorn workers instead, e.g. --workers $(nproc).
+for _var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(_var, "1")
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import HTMLResponse, ORJSONResponse
+from pydantic import BaseModel, Field
 import joblib
 import numpy as np
-from typing import List
-import os
+from starlette.responses import Response
+from typing import Dict, List, Optional
+import anyio.to_thread
+import array
+import brotli
+import gzip
+import hashlib
+import warnings
+
+from batching import MicroBatcher
+from kernel import (
+    infer_batch,
+    infer_batch_int8,
+    infer_batch_onnx,
+    load_c_kernel,
+    load_onnx_session,
+    quantize_weights
+)
+
+THREADPOOL_SIZE = 64
+
+# Dynamic batching window for concurrent /predict requests
+BATCH_MAX_SIZE = 64
+BATCH_MAX_WAIT_MS = 2
+
+# Serve /predict/batch from the int8-quantized weights (IRIS_INT8_WEIGHTS=1)
+USE_INT8_WEIGHTS = os.environ.get("IRIS_INT8_WEIGHTS", "0") == "1"
+
+# Dummy predictions run through each inference path at startup
+WARMUP_ITERATIONS = 3
+
+def warm_up():
+    """
+    Run dummy predictions through every inference path.
+    
+    Compiles (or loads from cache) the Numba kernel, initializes the ONNX
+    Runtime session and its memory arena, and touches the weight pages, so
+    startup takes a few ms longer but the first real request is as fast as
+    the rest.
+    """
+    x = np.zeros(4, dtype=np.float32)
+    X = np.zeros((1, 4), dtype=np.float32)
+    out = np.empty(len(b), dtype=np.float32)
+    
+    for _ in range(WARMUP_ITERATIONS):
+        batcher.kernel(x, out)
+        predict_proba_batch(X)
+        if USE_INT8_WEIGHTS:
+            infer_batch_int8(X, W_q, s_w, b)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm up inference and size the threadpool before serving traffic"""
+    warm_up()
+    
+    # Prediction handlers are sync and run in the threadpool, so allow more
+    # of them to run concurrently than the default of 40
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    
+    await batcher.start()
+    yield
+    await batcher.stop()
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Iris Flower Classification API",
     description="A machine learning API to classify Iris flowers based on their measurements",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
-# Load the trained model at startup
+# Load the trained model weights at startup. Inference only needs the
+# logistic regression coefficients and intercepts, so read them from the
+# raw NumPy files and fall back to unpickling model.pkl if they are missing.
+#
+# W and b are memory-mapped read-only from plain .npy files, so their pages
+# come from the OS page cache and are shared by every Uvicorn worker instead
+# of each worker holding its own copy. (.npz members cannot be mapped, so
+# W and b are only read from weights.npz when the .npy files are absent.)
+# Under gunicorn, set preload_app=True so workers fork after the weights are
+# loaded.
 try:
-    model = joblib.load("model.pkl")
-    class_names = ["setosa", "versicolor", "virginica"]
+    with np.load("weights.npz") as weights:
+        if os.path.exists("weights_W.npy") and os.path.exists("weights_b.npy"):
+            W = np.load("weights_W.npy", mmap_mode="r")
+            b = np.load("weights_b.npy", mmap_mode="r")
+        else:
+            W = np.ascontiguousarray(weights["W"], dtype=np.float32)
+            b = np.ascontiguousarray(weights["b"], dtype=np.float32)
+        class_names = weights["classes"].tolist()
+        
+        # int8 weights with per-class scales (quantized here for older archives)
+        if "W_q" in weights:
+            W_q, s_w = weights["W_q"], weights["s_w"]
+        else:
+            W_q, s_w = quantize_weights(W)
 except FileNotFoundError:
-    raise RuntimeError("Model file 'model.pkl' not found. Please train the model first.")
+    try:
+        model = joblib.load("model.pkl")
+    except FileNotFoundError:
+        raise RuntimeError("Model files 'weights.npz' and 'model.pkl' not found. Please train the model first.")
+    W = model.coef_.astype(np.float32)
+    b = model.intercept_.astype(np.float32)
+    class_names = ["setosa", "versicolor", "virginica"]
+    W_q, s_w = quantize_weights(W)
+
+# Class names as a tuple for building the probabilities dict with zip
+_CLASS_TUPLE = tuple(class_names)
+
+# Inputs used to check that the ONNX model and compiled C kernel match W and b
+_KERNEL_PROBES = np.array([
+    [5.1, 3.5, 1.4, 0.2],
+    [7.0, 3.2, 4.7, 1.4],
+    [6.3, 3.3, 6.0, 2.5]
+], dtype=np.float32)
+
+def load_checked_onnx_session(path: str):
+    """
+    Open the ONNX Runtime session if the exported model matches W and b.
+    
+    model.onnx is exported separately from weights.npz, so a stale export
+    (or the model.pkl fallback) would serve batches from a different model
+    than lone /predict requests. Returns None with a warning when the probe
+    predictions disagree.
+    """
+    session = load_onnx_session(path)
+    expected, _ = infer_batch(_KERNEL_PROBES, W, b)
+    actual, _ = infer_batch_onnx(session, _KERNEL_PROBES)
+    
+    if not np.allclose(actual, expected, atol=1e-4):
+        warnings.warn(
+            f"'{path}' does not match the loaded model weights; "
+            "re-export it with train_model.py. Using the NumPy kernel instead.",
+            RuntimeWarning
+        )
+        return None
+    return session
+
+# Batched inference runs through ONNX Runtime when the exported model is
+# available and matches W and b, otherwise through the NumPy kernel
+session = load_checked_onnx_session("model.onnx") if os.path.exists("model.onnx") else None
+
+def predict_proba_batch(X: np.ndarray):
+    """Return (probabilities, predicted classes) for a float32 (N, 4) batch"""
+    if session is not None:
+        return infer_batch_onnx(session, X)
+    return infer_batch(X, W, b)
+
+def load_checked_c_kernel(path: str):
+    """
+    Load the compiled C kernel if its baked-in weights match W and b.
+    
+    The kernel is generated with the weights from training, so a stale
+    build (or the model.pkl fallback) would serve lone /predict requests
+    from a different model than batches. Returns None with a warning when
+    the probe predictions disagree.
+    """
+    kernel = load_c_kernel(path)
+    expected, _ = infer_batch(_KERNEL_PROBES, W, b)
+    out = np.empty(len(b), dtype=np.float32)
+    
+    for x, p in zip(_KERNEL_PROBES, expected):
+        kernel(x, out)
+        if not np.allclose(out, p, atol=1e-4):
+            warnings.warn(
+                f"'{path}' does not match the loaded model weights; "
+                "rebuild it with train_model.py. Using the Numba kernel instead.",
+                RuntimeWarning
+            )
+            return None
+    return kernel
+
+# Lone /predict requests use the compiled C kernel when train_model.py has
+# built it for the current weights, otherwise the Numba kernel specialized
+# for W and b
+c_kernel = load_checked_c_kernel("_kernel.so") if os.path.exists("_kernel.so") else None
+
+# Fuses concurrent single predictions into one matmul
+batcher = MicroBatcher(
+    W,
+    b,
+    max_batch_size=BATCH_MAX_SIZE,
+    max_wait_ms=BATCH_MAX_WAIT_MS,
+    kernel=c_kernel,
+    batch_kernel=predict_proba_batch
+)
 
 # Pydantic models for request and response
 class IrisInput(BaseModel):
@@ -30,13 +210,6 @@ class IrisInput(BaseModel):
     sepal_width: float = Field(..., description="Sepal width in cm", ge=0, le=10)
     petal_length: float = Field(..., description="Petal length in cm", ge=0, le=10)
     petal_width: float = Field(..., description="Petal width in cm", ge=0, le=10)
-    
-    @field_validator('sepal_length', 'sepal_width', 'petal_length', 'petal_width')
-    @classmethod
-    def validate_measurements(cls, v):
-        if v < 0 or v > 10:
-            raise ValueError('Measurements must be between 0 and 10 cm')
-        return v
 
 class PredictionOutput(BaseModel):
     """Output data model for prediction results"""
@@ -49,11 +222,8 @@ class HealthCheck(BaseModel):
     status: str
     is_model_loaded: bool = Field(..., description="Whether the model is loaded")
 
-# API Endpoints
-@app.get("/", response_class=HTMLResponse, summary="Interactive Web Interface")
-async def root():
-    """Interactive web interface for testing the Iris classification API"""
-    html_content = """
+# Interactive web interface, encoded once at import time
+html_content = """
     <!DOCTYPE html>
     <html lang="en">
     <head>
@@ -445,18 +615,110 @@ async def root():
         </script>
     </body>
     </html>
+"""
+
+_HTML_BYTES = html_content.encode("utf-8")
+
+# Precompress the page once so GET / never compresses per request
+_HTML_BR = brotli.compress(_HTML_BYTES, quality=11)
+_HTML_GZ = gzip.compress(_HTML_BYTES, compresslevel=9)
+# Each encoding is a separate representation, so each gets its own strong
+# ETag (RFC 9110 8.8.3)
+_HTML_HASH = hashlib.sha256(_HTML_BYTES).hexdigest()[:32]
+
+_HTML_HEADERS = {
+    "Cache-Control": "public, max-age=3600",
+    "Vary": "Accept-Encoding"
+}
+
+def _html_response(body: bytes, etag: str, encoding: Optional[str] = None) -> Response:
+    """Build a prebuilt homepage response for the given content encoding"""
+    headers = dict(_HTML_HEADERS, ETag=etag)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="text/html; charset=utf-8", headers=headers)
+
+def _html_variant(body: bytes, suffix: str = "", encoding: Optional[str] = None):
+    """Return (ETag, 200 response, 304 response) for one homepage encoding"""
+    etag = f'"{_HTML_HASH}{suffix}"'
+    not_modified = Response(status_code=304, headers=dict(_HTML_HEADERS, ETag=etag))
+    return etag, _html_response(body, etag, encoding), not_modified
+
+_HTML_VARIANT = _html_variant(_HTML_BYTES)
+_HTML_VARIANT_BR = _html_variant(_HTML_BR, "-br", "br")
+_HTML_VARIANT_GZ = _html_variant(_HTML_GZ, "-gz", "gzip")
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Check an If-None-Match header against an ETag (weak comparison)"""
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+def _encoding_qvalues(accept_encoding: str) -> Dict[str, float]:
+    """Parse an Accept-Encoding header into a {coding: q} mapping"""
+    qvalues = {}
+    for item in accept_encoding.split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qvalues[coding.lower()] = q
+    return qvalues
+
+def _select_html_variant(accept_encoding: str):
     """
-    return HTMLResponse(content=html_content)
+    Pick the homepage variant for an Accept-Encoding header.
+    
+    br or gzip is only used when the client accepts it with q > 0 (listed
+    explicitly or through *); the higher q wins, with br preferred on ties.
+    Anything else gets the uncompressed page.
+    """
+    qvalues = _encoding_qvalues(accept_encoding)
+    wildcard = qvalues.get("*", 0.0)
+    q_br = qvalues.get("br", wildcard)
+    q_gzip = qvalues.get("gzip", qvalues.get("x-gzip", wildcard))
+    
+    if q_br > 0 and q_br >= q_gzip:
+        return _HTML_VARIANT_BR
+    if q_gzip > 0:
+        return _HTML_VARIANT_GZ
+    return _HTML_VARIANT
+
+# API Endpoints
+@app.get("/", response_class=HTMLResponse, summary="Interactive Web Interface")
+async def root(request: Request):
+    """Interactive web interface for testing the Iris classification API"""
+    etag, response, not_modified = _select_html_variant(
+        request.headers.get("accept-encoding", "")
+    )
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return not_modified
+    return response
 
 @app.get("/health", response_model=HealthCheck, summary="Health check")
-async def health_check():
+def health_check():
     """Check if the API and model are working properly"""
     return HealthCheck(
         status="healthy",
-        is_model_loaded=model is not None
+        is_model_loaded=W is not None
     )
 
-@app.post("/predict", response_model=PredictionOutput, summary="Predict Iris species")
+@app.post(
+    "/predict",
+    summary="Predict Iris species",
+    responses={200: {"model": PredictionOutput}}
+)
 async def predict_iris(input_data: IrisInput):
     """
     Predict the Iris flower species based on sepal and petal measurements.
@@ -469,33 +731,33 @@ async def predict_iris(input_data: IrisInput):
     Returns the predicted species with confidence score and all class probabilities.
     """
     try:
-        # Prepare the input features
-        features = np.array([[
+        # Prepare the input features (array.array fills a float32 buffer in
+        # one pass, skipping np.array's per-element type inference)
+        x = np.frombuffer(array.array("f", (
             input_data.sepal_length,
             input_data.sepal_width,
             input_data.petal_length,
             input_data.petal_width
-        ]])
+        )), dtype=np.float32)
         
-        # Make prediction
-        prediction = model.predict(features)[0]
-        probabilities = model.predict_proba(features)[0]
+        # Make prediction, batched with any concurrent requests
+        prediction, probabilities = await batcher.predict(x)
         
         # Prepare response
+        probabilities = probabilities.tolist()
         predicted_species = class_names[prediction]
-        confidence = float(probabilities[prediction])
+        confidence = probabilities[prediction]
         
         # Create probabilities dictionary
-        prob_dict = {
-            class_names[i]: float(probabilities[i]) 
-            for i in range(len(class_names))
-        }
+        prob_dict = dict(zip(_CLASS_TUPLE, probabilities))
         
-        return PredictionOutput(
-            species=predicted_species,
-            confidence=confidence,
-            probabilities=prob_dict
-        )
+        # Values are freshly computed, so skip response model validation
+        # and serialize directly
+        return ORJSONResponse({
+            "species": predicted_species,
+            "confidence": confidence,
+            "probabilities": prob_dict
+        })
     
     except Exception as e:
         raise HTTPException(
@@ -504,44 +766,45 @@ async def predict_iris(input_data: IrisInput):
         )
 
 @app.post("/predict/batch", summary="Batch prediction")
-async def predict_batch(input_list: List[IrisInput]):
+def predict_batch(input_list: List[IrisInput]):
     """
     Predict multiple Iris flowers at once.
     
     Takes a list of flower measurements and returns predictions for each.
     """
     try:
+        # Fill one preallocated column per feature, then assemble a single
+        # contiguous (N, 4) feature matrix
+        n = len(input_list)
+        sepal_length = np.empty(n, dtype=np.float32)
+        sepal_width = np.empty_like(sepal_length)
+        petal_length = np.empty_like(sepal_length)
+        petal_width = np.empty_like(sepal_length)
+        
+        for i, input_data in enumerate(input_list):
+            sepal_length[i] = input_data.sepal_length
+            sepal_width[i] = input_data.sepal_width
+            petal_length[i] = input_data.petal_length
+            petal_width[i] = input_data.petal_width
+        
+        X = np.stack((sepal_length, sepal_width, petal_length, petal_width), axis=1)
+        
+        # Make predictions for the whole batch with one matmul + softmax
+        if USE_INT8_WEIGHTS:
+            P, preds = infer_batch_int8(X, W_q, s_w, b)
+        else:
+            P, preds = predict_proba_batch(X)
+        
         predictions = []
         
-        for input_data in input_list:
-            # Prepare features
-            features = np.array([[
-                input_data.sepal_length,
-                input_data.sepal_width,
-                input_data.petal_length,
-                input_data.petal_width
-            ]])
-            
-            # Make prediction
-            prediction = model.predict(features)[0]
-            probabilities = model.predict_proba(features)[0]
-            
-            # Prepare response
-            predicted_species = class_names[prediction]
-            confidence = float(probabilities[prediction])
-            
-            prob_dict = {
-                class_names[i]: float(probabilities[i]) 
-                for i in range(len(class_names))
-            }
-            
-            predictions.append(PredictionOutput(
-                species=predicted_species,
-                confidence=confidence,
-                probabilities=prob_dict
-            ))
+        for prediction, probabilities in zip(preds.tolist(), P.tolist()):
+            predictions.append({
+                "species": class_names[prediction],
+                "confidence": probabilities[prediction],
+                "probabilities": dict(zip(_CLASS_TUPLE, probabilities))
+            })
         
-        return {"predictions": predictions}
+        return ORJSONResponse({"predictions": predictions})
     
     except Exception as e:
         raise HTTPException(
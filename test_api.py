@@ -2,11 +2,20 @@
 Test examples for the Iris Classification API
 """
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 import json
 
 # API base URL
 BASE_URL = "http://localhost:8001"
 
+# Concurrent /predict requests sent to exercise server-side batching
+CONCURRENT_REQUESTS = 8
+
+# Shared session so every test reuses keep-alive connections
+session = requests.Session()
+session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=CONCURRENT_REQUESTS))
+
 # Test data examples
 test_examples = [
     {
@@ -44,7 +53,7 @@ test_examples = [
 def test_health_endpoint():
     """Test the health check endpoint"""
     try:
-        response = requests.get(f"{BASE_URL}/health")
+        response = session.get(f"{BASE_URL}/health")
         print(f"Health Check: {response.status_code}")
         print(json.dumps(response.json(), indent=2))
         return response.status_code == 200
@@ -58,34 +67,79 @@ def test_prediction_endpoint():
     print("TESTING PREDICTION ENDPOINT")
     print("="*50)
     
-    for example in test_examples:
-        try:
-            response = requests.post(
-                f"{BASE_URL}/predict",
-                json=example["data"]
-            )
-            
+    try:
+        # Classify all examples in one round-trip
+        response = session.post(
+            f"{BASE_URL}/predict/batch",
+            json=[example["data"] for example in test_examples]
+        )
+        
+        if response.status_code != 200:
+            print(f"❌ Request failed: {response.status_code}")
+            print(response.text)
+            return
+        
+        predictions = response.json()["predictions"]
+        
+        for example, result in zip(test_examples, predictions):
             print(f"\n{example['name']}:")
             print(f"Input: {example['data']}")
             print(f"Expected: {example['expected']}")
+            print(f"Predicted: {result['species']}")
+            print(f"Confidence: {result['confidence']:.4f}")
+            print(f"All Probabilities: {result['probabilities']}")
             
-            if response.status_code == 200:
-                result = response.json()
-                print(f"Predicted: {result['species']}")
-                print(f"Confidence: {result['confidence']:.4f}")
-                print(f"All Probabilities: {result['probabilities']}")
-                
-                # Check if prediction matches expected
-                if result['species'] == example['expected']:
-                    print("✅ Prediction CORRECT")
-                else:
-                    print("❌ Prediction INCORRECT")
+            # Check if prediction matches expected
+            if result['species'] == example['expected']:
+                print("✅ Prediction CORRECT")
             else:
-                print(f"❌ Request failed: {response.status_code}")
-                print(response.text)
+                print("❌ Prediction INCORRECT")
                 
-        except Exception as e:
-            print(f"❌ Test failed: {e}")
+    except Exception as e:
+        print(f"❌ Test failed: {e}")
+
+def check_prediction(example, response):
+    """Check a /predict response against an example's expected species"""
+    if response.status_code != 200:
+        print(f"❌ {example['name']} request failed: {response.status_code}")
+        print(response.text)
+        return False
+    
+    result = response.json()
+    total = sum(result['probabilities'].values())
+    
+    if result['species'] != example['expected']:
+        print(f"❌ {example['name']}: predicted {result['species']}, expected {example['expected']}")
+        return False
+    if abs(total - 1) > 1e-3:
+        print(f"❌ {example['name']}: probabilities sum to {total:.6f}")
+        return False
+    return True
+
+def test_single_prediction():
+    """Test the single prediction endpoint, one at a time and concurrently"""
+    print("\n" + "="*50)
+    print("TESTING SINGLE PREDICTION ENDPOINT")
+    print("="*50)
+    
+    def predict(example):
+        return example, session.post(f"{BASE_URL}/predict", json=example["data"])
+    
+    try:
+        # One request at a time (served by the single-sample kernel)
+        if all(check_prediction(*predict(example)) for example in test_examples):
+            print("✅ Sequential predictions CORRECT")
+        
+        # Many requests at once so the server fuses them into batches
+        examples = test_examples * CONCURRENT_REQUESTS
+        with ThreadPoolExecutor(max_workers=CONCURRENT_REQUESTS) as executor:
+            results = list(executor.map(predict, examples))
+        
+        if all([check_prediction(*result) for result in results]):
+            print(f"✅ {len(results)} concurrent predictions CORRECT")
+            
+    except Exception as e:
+        print(f"❌ Test failed: {e}")
 
 def test_batch_prediction():
     """Test the batch prediction endpoint"""
@@ -96,7 +150,7 @@ def test_batch_prediction():
     batch_data = [example["data"] for example in test_examples]
     
     try:
-        response = requests.post(
+        response = session.post(
             f"{BASE_URL}/predict/batch",
             json=batch_data
         )
@@ -154,7 +208,7 @@ def test_invalid_input():
     
     for example in invalid_examples:
         try:
-            response = requests.post(
+            response = session.post(
                 f"{BASE_URL}/predict",
                 json=example["data"]
             )
@@ -181,6 +235,7 @@ if __name__ == "__main__":
         
         # Test prediction endpoints
         test_prediction_endpoint()
+        test_single_prediction()
         test_batch_prediction()
         test_invalid_input()
         
@@ -6,6 +6,11 @@ from sklearn.model_selection import train_test_split
 from sklearn.linear_model import LogisticRegression
 from sklearn.metrics import accuracy_score, classification_report
 import joblib
+import numpy as np
+import subprocess
+from skl2onnx import to_onnx
+
+from kernel import build_c_kernel, generate_c_kernel, quantize_weights
 
 def train_iris_model():
     """Train and save the Iris classification model"""
@@ -35,6 +40,49 @@ def train_iris_model():
     joblib.dump(model, "model.pkl")
     print("\nModel saved as 'model.pkl'")
     
+    # Save the raw weights used by the API for inference, along with an
+    # int8 copy of W quantized with one scale per class
+    W = model.coef_.astype(np.float32)
+    b = model.intercept_.astype(np.float32)
+    W_q, s_w = quantize_weights(W)
+    np.savez(
+        "weights.npz",
+        W=W,
+        b=b,
+        W_q=W_q,
+        s_w=s_w,
+        classes=np.array(iris.target_names)
+    )
+    print("Weights saved as 'weights.npz'")
+    
+    # Also save W and b as plain .npy files, which the API memory-maps
+    np.save("weights_W.npy", W)
+    np.save("weights_b.npy", b)
+    print("Weights saved as 'weights_W.npy' and 'weights_b.npy'")
+    
+    # Export to ONNX for batched inference with ONNX Runtime. Probabilities
+    # are returned as a plain (N, 3) tensor rather than a list of dicts.
+    onx = to_onnx(
+        model,
+        X_train[:1].astype(np.float32),
+        options={"zipmap": False},
+        target_opset=17
+    )
+    with open("model.onnx", "wb") as f:
+        f.write(onx.SerializeToString())
+    print("ONNX model saved as 'model.onnx'")
+    
+    # Generate the C inference kernel with the weights baked in and build it
+    # for this machine (-march=native, so rebuild on each deployment host)
+    with open("kernel.c", "w") as f:
+        f.write(generate_c_kernel(W, model.intercept_))
+    print("C kernel saved as 'kernel.c'")
+    try:
+        build_c_kernel("kernel.c", "_kernel.so")
+        print("C kernel built as '_kernel.so'")
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"Could not build '_kernel.so' ({e}); the API will use the Numba kernel")
+    
     return model, iris.target_names
 
 if __name__ == "__main__":